@@ -1,29 +1,27 @@
 """Pytest configuration and fixtures."""
 
-import asyncio
 import os
 import tempfile
+from datetime import datetime
+from types import SimpleNamespace
 from typing import AsyncGenerator
 
+import aiosqlite
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
 from httpx import AsyncClient
+from starlette.datastructures import FormData
 
-# Set test environment variables before imports
+# Set test environment variables before imports. Each pytest-xdist worker is
+# its own process with its own in-memory database; only on-disk paths need a
+# per-worker suffix.
+_XDIST_WORKER = os.environ.get("PYTEST_XDIST_WORKER", "gw0")
 os.environ["DATABASE_PATH"] = ":memory:"
-os.environ["ENCRYPTION_KEY_FILE"] = "/tmp/test_encryption.key"
+os.environ["ENCRYPTION_KEY_FILE"] = f"/tmp/test_encryption_{_XDIST_WORKER}.key"
 os.environ["PUBLIC_URL"] = "http://localhost:3000"
 
 
-@pytest.fixture(scope="session")
-def event_loop():
-    """Create event loop for async tests."""
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
-
-
 @pytest.fixture(scope="function")
 def test_encryption_key():
     """Create a temporary encryption key for tests."""
@@ -45,22 +43,59 @@ def test_encryption_key():
         os.remove(key_path)
 
 
-@pytest_asyncio.fixture
-async def test_db():
-    """Create a test database."""
-    from app.database import get_database, close_database, init_schema, _db_connection
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def _session_db():
+    """Open the in-memory test database once and snapshot its freshly built schema."""
     import app.database as db_module
 
-    # Reset the global connection
     db_module._db_connection = None
+    db = await db_module.get_database()
+    # Durability is irrelevant for a throwaway database.
+    await db.executescript(
+        "PRAGMA synchronous = OFF; PRAGMA journal_mode = MEMORY; PRAGMA temp_store = MEMORY;"
+        "PRAGMA cache_size = -64000;"
+    )
+
+    # SQLite's backup API copies pages directly, which is cheaper than
+    # deleting from every table between tests.
+    template = await aiosqlite.connect(":memory:", check_same_thread=False)
+    await db.backup(template)
+
+    yield db, template
+
+    await template.close()
+    db_module._db_connection = db
+    await db_module.close_database()
+    db_module._db_connection = None
+
+
+@pytest_asyncio.fixture
+async def _clean_db(_session_db):
+    """Restore the empty-schema snapshot before the test so leftovers cannot leak in."""
+    db, template = _session_db
+    # A transaction left open by a failed test would make the backup fail with
+    # "destination database is in use" for every later test.
+    if db.in_transaction:
+        await db.rollback()
+    await template.backup(db)
+    return db
+
 
-    # Create in-memory database
-    db = await get_database()
-    await init_schema(db)
+@pytest_asyncio.fixture
+async def test_db(_clean_db):
+    """Provide the shared session database, reset to an empty schema before each test.
+
+    The app commits on its own connection, so a per-test SAVEPOINT would be
+    released by the code under test; restoring a snapshot keeps isolation instead.
+    """
+    import app.database as db_module
+
+    db_module._db_connection = _clean_db
 
-    yield db
+    yield _clean_db
 
-    await close_database()
+    if _clean_db.in_transaction:
+        await _clean_db.rollback()
     db_module._db_connection = None
 
 
@@ -95,6 +130,120 @@ def async_fake(sync_obj):
     return wrapper
 
 
+class FakeFormRequest:
+    """Minimal request object with async form() for route unit tests."""
+
+    def __init__(self, form_data: FormData | dict):
+        self._form_data = form_data if isinstance(form_data, FormData) else FormData(form_data)
+        self.url = SimpleNamespace(path="/setup")
+
+    async def form(self):
+        # Returned without copying: tests share module-level instances.
+        return self._form_data
+
+
+@pytest.fixture
+def oobe_data():
+    """Hand the test an empty setup-wizard state, restoring the original afterwards.
+
+    The dict is cleared in place so every reference to ``app.ui.setup._oobe_data``
+    sees the same object.
+    """
+    from app.ui import setup as setup_module
+
+    saved = dict(setup_module._oobe_data)
+    setup_module._oobe_data.clear()
+    yield setup_module._oobe_data
+    setup_module._oobe_data.clear()
+    setup_module._oobe_data.update(saved)
+
+
+async def _fake_access_token(_user_id: int, _email: str) -> str:
+    return "token"
+
+
+@pytest.fixture
+def fake_access_token(monkeypatch):
+    """Make get_valid_access_token return a fixed token; opt in with usefixtures."""
+    monkeypatch.setattr("app.auth.google.get_valid_access_token", _fake_access_token)
+
+
+FROZEN_NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+
+class FrozenDatetime(datetime):
+    """``datetime`` whose ``utcnow()`` is pinned to ``FROZEN_NOW``."""
+
+    @classmethod
+    def utcnow(cls):
+        return FROZEN_NOW
+
+
+def freeze_utcnow(monkeypatch, module) -> None:
+    """Swap ``module.datetime`` for ``FrozenDatetime`` for the rest of the test."""
+    monkeypatch.setattr(module, "datetime", FrozenDatetime)
+
+
+INSERT_USER_SQL = """INSERT INTO users (email, google_user_id, display_name, main_calendar_id)
+   VALUES (?, ?, ?, ?)"""
+
+_INSERT_CLIENT_TOKEN_SQL = """INSERT INTO oauth_tokens
+   (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
+   VALUES (?, 'client', ?, ?, ?)"""
+
+_INSERT_CLIENT_CALENDAR_SQL = """INSERT INTO client_calendars
+   (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
+   VALUES (?, ?, ?, ?, TRUE)"""
+
+_SELECT_CLIENT_CALENDAR_IDS_SQL = "SELECT id FROM client_calendars WHERE user_id = ? ORDER BY id"
+
+
+async def seed_user(
+    db,
+    email: str = "user@example.com",
+    google_user_id: str = "google-user-1",
+    main_calendar_id: str | None = "main-calendar",
+    tokens: tuple[str, ...] = (),
+    calendars: tuple[tuple[int, str], ...] = (),
+) -> tuple[int, list[int], list[int]]:
+    """Insert a user with client tokens and active calendars in a single transaction.
+
+    ``calendars`` holds ``(token_index, google_calendar_id)`` pairs indexing into
+    ``tokens``; the returned calendar ids follow the same order.
+    """
+    await db.execute("BEGIN")
+    try:
+        cursor = await db.execute(
+            INSERT_USER_SQL,
+            (email, google_user_id, email.split("@")[0], main_calendar_id),
+        )
+        user_id = cursor.lastrowid
+        token_ids = []
+        for token_email in tokens:
+            cursor = await db.execute(
+                _INSERT_CLIENT_TOKEN_SQL, (user_id, token_email, b"a", b"r")
+            )
+            token_ids.append(cursor.lastrowid)
+        calendar_ids = []
+        if calendars:
+            await db.executemany(
+                _INSERT_CLIENT_CALENDAR_SQL,
+                [
+                    (user_id, token_ids[token_index], calendar_id, calendar_id)
+                    for token_index, calendar_id in calendars
+                ],
+            )
+            # The user row is new, so its calendars are exactly the rows just
+            # inserted and ascending ids follow insertion order.
+            cursor = await db.execute(_SELECT_CLIENT_CALENDAR_IDS_SQL, (user_id,))
+            calendar_ids = [row[0] for row in await cursor.fetchall()]
+    except BaseException:
+        await db.rollback()
+        raise
+    await db.commit()
+    return user_id, token_ids, calendar_ids
+
+
 @pytest.fixture
 def mock_google_api(mocker):
     """Mock Google API calls."""
@@ -83,114 +83,107 @@ def test_copy_event_for_main_with_recurrence():
     assert result["summary"] == f"{get_settings().managed_event_prefix} Weekly Standup".strip()
 
 
-def test_should_create_busy_block_normal_event():
-    """Test busy block decision for normal event."""
-    event = {
-        "id": "event1",
-        "status": "confirmed",
-        "start": {"dateTime": "2024-01-15T10:00:00Z"},
-        "end": {"dateTime": "2024-01-15T11:00:00Z"},
-    }
-
-    assert should_create_busy_block(event) is True
-
-
-def test_should_create_busy_block_cancelled():
-    """Test busy block decision for cancelled event."""
-    event = {
-        "id": "event1",
-        "status": "cancelled",
-    }
-
-    assert should_create_busy_block(event) is False
-
-
-def test_should_create_busy_block_declined():
-    """Test busy block decision for declined event."""
-    event = {
-        "id": "event1",
-        "status": "confirmed",
-        "start": {"dateTime": "2024-01-15T10:00:00Z"},
-        "attendees": [
-            {"email": "me@example.com", "self": True, "responseStatus": "declined"},
-        ],
-    }
-
-    assert should_create_busy_block(event) is False
-
-
-def test_should_create_busy_block_all_day_free():
-    """Test busy block decision for free all-day event."""
-    event = {
-        "id": "event1",
-        "status": "confirmed",
-        "start": {"date": "2024-01-15"},
-        "end": {"date": "2024-01-16"},
-        "transparency": "transparent",  # Free
-    }
-
-    assert should_create_busy_block(event) is False
-
-
-def test_should_create_busy_block_all_day_busy():
-    """Test busy block decision for busy all-day event."""
-    event = {
-        "id": "event1",
-        "status": "confirmed",
-        "start": {"date": "2024-01-15"},
-        "end": {"date": "2024-01-16"},
-        "transparency": "opaque",  # Busy
-    }
-
-    assert should_create_busy_block(event) is True
-
-
-def test_can_user_edit_event_organizer():
-    """Test edit permission when user is organizer."""
-    event = {
-        "organizer": {"email": "me@example.com"},
-    }
-
-    assert can_user_edit_event(event, "me@example.com") is True
-
-
-def test_can_user_edit_event_organizer_self():
-    """Test edit permission when user is marked as self organizer."""
-    event = {
-        "organizer": {"email": "me@example.com", "self": True},
-    }
-
-    assert can_user_edit_event(event, "other@example.com") is True
-
-
-def test_can_user_edit_event_creator():
-    """Test edit permission when user is creator."""
-    event = {
-        "organizer": {"email": "other@example.com"},
-        "creator": {"email": "me@example.com"},
-    }
-
-    assert can_user_edit_event(event, "me@example.com") is True
-
-
-def test_can_user_edit_event_guests_can_modify():
-    """Test edit permission when guestsCanModify is true."""
-    event = {
-        "organizer": {"email": "other@example.com"},
-        "guestsCanModify": True,
-    }
-
-    assert can_user_edit_event(event, "me@example.com") is True
-
-
-def test_can_user_edit_event_no_permission():
-    """Test no edit permission."""
-    event = {
-        "organizer": {"email": "other@example.com"},
-        "creator": {"email": "other@example.com"},
-    }
-
-    assert can_user_edit_event(event, "me@example.com") is False
+@pytest.mark.parametrize(
+    "event, expected",
+    [
+        (
+            {
+                "id": "event1",
+                "status": "confirmed",
+                "start": {"dateTime": "2024-01-15T10:00:00Z"},
+                "end": {"dateTime": "2024-01-15T11:00:00Z"},
+            },
+            True,
+        ),
+        (
+            {
+                "id": "event1",
+                "status": "cancelled",
+            },
+            False,
+        ),
+        (
+            {
+                "id": "event1",
+                "status": "confirmed",
+                "start": {"dateTime": "2024-01-15T10:00:00Z"},
+                "attendees": [
+                    {"email": "me@example.com", "self": True, "responseStatus": "declined"},
+                ],
+            },
+            False,
+        ),
+        (
+            {
+                "id": "event1",
+                "status": "confirmed",
+                "start": {"date": "2024-01-15"},
+                "end": {"date": "2024-01-16"},
+                "transparency": "transparent",  # Free
+            },
+            False,
+        ),
+        (
+            {
+                "id": "event1",
+                "status": "confirmed",
+                "start": {"date": "2024-01-15"},
+                "end": {"date": "2024-01-16"},
+                "transparency": "opaque",  # Busy
+            },
+            True,
+        ),
+    ],
+    ids=["normal", "cancelled", "declined", "all_day_free", "all_day_busy"],
+)
+def test_should_create_busy_block(event, expected):
+    """Test busy block decision for normal, cancelled, declined and all-day events."""
+    assert should_create_busy_block(event) is expected
+
+
+@pytest.mark.parametrize(
+    "event, user_email, expected",
+    [
+        (
+            {"organizer": {"email": "me@example.com"}},
+            "me@example.com",
+            True,
+        ),
+        (
+            {"organizer": {"email": "me@example.com", "self": True}},
+            "other@example.com",
+            True,
+        ),
+        (
+            {
+                "organizer": {"email": "other@example.com"},
+                "creator": {"email": "me@example.com"},
+            },
+            "me@example.com",
+            True,
+        ),
+        (
+            {
+                "organizer": {"email": "other@example.com"},
+                "guestsCanModify": True,
+            },
+            "me@example.com",
+            True,
+        ),
+        (
+            {
+                "organizer": {"email": "other@example.com"},
+                "creator": {"email": "other@example.com"},
+            },
+            "me@example.com",
+            False,
+        ),
+    ],
+    ids=["organizer", "organizer_self", "creator", "guests_can_modify", "no_permission"],
+)
+def test_can_user_edit_event(event, user_email, expected):
+    """Test edit permission for organizer, creator, guestsCanModify and no-permission cases."""
+    assert can_user_edit_event(event, user_email) is expected
 
 
 def test_copy_event_for_main_with_color():
@@ -6,8 +6,50 @@ from itertools import count
 
 import pytest
 
-from tests.conftest import async_fake
+from tests.conftest import INSERT_USER_SQL, async_fake
 from app.database import get_database
+from app.sync.rules import (
+    handle_deleted_client_event,
+    handle_deleted_main_event,
+    sync_client_event_to_main,
+    sync_main_event_to_clients,
+)
+
+
+pytestmark = pytest.mark.usefixtures("fake_access_token")
+
+
+class _NoOpMainClient:
+    """Client fake that never claims ownership of an event."""
+
+    def is_our_event(self, _event):
+        return False
+
+
+_NOOP_MAIN = _NoOpMainClient()
+
+
+class _FakeMainClient:
+    def __init__(self):
+        self.updated = []
+
+    def create_event(self, _calendar_id: str, _event_data: dict):
+        return {"id": "main-created"}
+
+    def update_event(self, _calendar_id: str, event_id: str, _event_data: dict):
+        self.updated.append(event_id)
+        return {"id": event_id}
+
+
+_INSERT_TOKEN_SQL = """INSERT INTO oauth_tokens
+   (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
+   VALUES (?, 'client', ?, ?, ?)
+   RETURNING id"""
+
+_INSERT_CALENDAR_SQL = """INSERT INTO client_calendars
+   (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
+   VALUES (?, ?, ?, ?, TRUE)
+   RETURNING id"""
 
 
 async def _insert_user(
@@ -16,67 +58,44 @@ async def _insert_user(
 ) -> int:
     db = await get_database()
     cursor = await db.execute(
-        """INSERT INTO users (email, google_user_id, display_name, main_calendar_id)
-           VALUES (?, ?, ?, ?)
-           RETURNING id""",
+        INSERT_USER_SQL,
         (email, google_user_id, "User", "main-cal"),
     )
-    row = await cursor.fetchone()
     await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
 async def _insert_token(user_id: int, email: str) -> int:
     db = await get_database()
     cursor = await db.execute(
-        """INSERT INTO oauth_tokens
-           (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
-           VALUES (?, 'client', ?, ?, ?)
-           RETURNING id""",
+        _INSERT_TOKEN_SQL,
         (user_id, email, b"a", b"r"),
     )
-    row = await cursor.fetchone()
     await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
 async def _insert_calendar(user_id: int, token_id: int, calendar_id: str) -> int:
     db = await get_database()
     cursor = await db.execute(
-        """INSERT INTO client_calendars
-           (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
-           VALUES (?, ?, ?, ?, TRUE)
-           RETURNING id""",
+        _INSERT_CALENDAR_SQL,
         (user_id, token_id, calendar_id, calendar_id),
     )
-    row = await cursor.fetchone()
     await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
 @pytest.mark.asyncio
 async def test_sync_client_event_to_main_all_day_and_update_success(test_db):
     """Client->main sync should parse all-day dates and cover update-success path."""
-    from app.sync.rules import sync_client_event_to_main
 
     user_id = await _insert_user()
     token_id = await _insert_token(user_id, "client@example.com")
     calendar_id = await _insert_calendar(user_id, token_id, "client-cal")
     db = await get_database()
 
-    class FakeMainClient:
-        def __init__(self):
-            self.updated = []
-
-        def create_event(self, _calendar_id: str, _event_data: dict):
-            return {"id": "main-created"}
-
-        def update_event(self, _calendar_id: str, event_id: str, _event_data: dict):
-            self.updated.append(event_id)
-            return {"id": event_id}
-
-    main_client = async_fake(FakeMainClient())
-    client = async_fake(type("Client", (), {"is_our_event": lambda self, _event: False})())
+    main_client = async_fake(_FakeMainClient())
+    client = async_fake(_NOOP_MAIN)
 
     all_day_event = {
         "id": "all-day-1",
@@ -126,7 +145,6 @@ async def test_sync_client_event_to_main_all_day_and_update_success(test_db):
 @pytest.mark.asyncio
 async def test_sync_main_event_to_clients_replacement_and_recurrence_paths(test_db, monkeypatch):
     """Main->client sync should copy recurrence and repoint busy-block mapping on replacement."""
-    from app.sync.rules import sync_main_event_to_clients
 
     user_id = await _insert_user(email="main@example.com", google_user_id="main-google")
     token_id = await _insert_token(user_id, "client@example.com")
@@ -148,9 +166,6 @@ async def test_sync_main_event_to_clients_replacement_and_recurrence_paths(test_
     )
     await db.commit()
 
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
     captures = {"created_body": None}
 
     class ReplacementClient:
@@ -167,10 +182,9 @@ async def test_sync_main_event_to_clients_replacement_and_recurrence_paths(test_
         def delete_event(self, _calendar_id: str, _event_id: str):
             raise RuntimeError("delete old failed")
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
     monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", ReplacementClient)
 
-    main_client = async_fake(type("MainClient", (), {"is_our_event": lambda self, _event: False})())
+    main_client = async_fake(_NOOP_MAIN)
     event = {
         "id": "main-rec-1",
         "status": "confirmed",
@@ -203,7 +217,6 @@ async def test_sync_main_event_to_clients_replacement_and_recurrence_paths(test_
 @pytest.mark.asyncio
 async def test_sync_main_event_to_clients_per_calendar_failure_path(test_db, monkeypatch):
     """Main->client sync should tolerate per-calendar errors and continue."""
-    from app.sync.rules import sync_main_event_to_clients
 
     user_id = await _insert_user(email="multi@example.com", google_user_id="multi-google")
     token_1 = await _insert_token(user_id, "fail@example.com")
@@ -228,7 +241,7 @@ async def test_sync_main_event_to_clients_per_calendar_failure_path(test_db, mon
     monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
     monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", CreateOnlyClient)
 
-    main_client = async_fake(type("MainClient", (), {"is_our_event": lambda self, _event: False})())
+    main_client = async_fake(_NOOP_MAIN)
     event = {
         "id": "main-err-path",
         "status": "confirmed",
@@ -257,7 +270,6 @@ async def test_sync_main_event_to_clients_per_calendar_failure_path(test_db, mon
 @pytest.mark.asyncio
 async def test_handle_deleted_client_event_error_logging_paths(test_db, monkeypatch):
     """Deleted client event handler should survive main/busy-block deletion errors."""
-    from app.sync.rules import handle_deleted_client_event
 
     user_id = await _insert_user(email="del-client@example.com", google_user_id="del-client-google")
     token_id = await _insert_token(user_id, "del-client-token@example.com")
@@ -279,9 +291,6 @@ async def test_handle_deleted_client_event_error_logging_paths(test_db, monkeypa
     )
     await db.commit()
 
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
     class FailingDeleteClient:
         def __init__(self, _token: str):
             pass
@@ -293,7 +302,6 @@ async def test_handle_deleted_client_event_error_logging_paths(test_db, monkeypa
         def delete_event(self, *_args, **_kwargs):
             raise RuntimeError("main delete failed")
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
     monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FailingDeleteClient)
 
     await handle_deleted_client_event(
@@ -311,7 +319,6 @@ async def test_handle_deleted_client_event_error_logging_paths(test_db, monkeypa
 @pytest.mark.asyncio
 async def test_handle_deleted_main_event_error_logging_paths(test_db, monkeypatch):
     """Deleted main event handler should survive client and busy-block deletion errors."""
-    from app.sync.rules import handle_deleted_main_event
 
     user_id = await _insert_user(email="del-main@example.com", google_user_id="del-main-google")
     token_id = await _insert_token(user_id, "del-main-client@example.com")
@@ -333,9 +340,6 @@ async def test_handle_deleted_main_event_error_logging_paths(test_db, monkeypatc
     )
     await db.commit()
 
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
     class FailingDeleteClient:
         def __init__(self, _token: str):
             pass
@@ -343,7 +347,6 @@ async def test_handle_deleted_main_event_error_logging_paths(test_db, monkeypatc
         def delete_event(self, *_args, **_kwargs):
             raise RuntimeError("delete failed")
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
     monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FailingDeleteClient)
 
     await handle_deleted_main_event(user_id=user_id, event_id="main-delete")
@@ -2,71 +2,84 @@
 
 from __future__ import annotations
 
-from datetime import datetime
 from itertools import count
 from types import SimpleNamespace
 
 import pytest
 
-from tests.conftest import async_fake
-from app.database import get_database
+from app.sync.rules import (
+    handle_deleted_client_event,
+    handle_deleted_main_event,
+    sync_client_event_to_main,
+    sync_main_event_to_clients,
+)
+from tests.conftest import async_fake, seed_user
 
 
-async def _insert_user(
-    email: str = "user@example.com",
-    google_user_id: str = "google-user-1",
-) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO users (email, google_user_id, display_name, main_calendar_id)
-           VALUES (?, ?, ?, ?)
-           RETURNING id""",
-        (email, google_user_id, "User", "main-calendar"),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+pytestmark = pytest.mark.usefixtures("fake_access_token")
 
 
-async def _insert_token(user_id: int, email: str) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO oauth_tokens
-           (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
-           VALUES (?, 'client', ?, ?, ?)
-           RETURNING id""",
-        (user_id, email, b"a", b"r"),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+_CLIENT_OWNS = SimpleNamespace(is_our_event=lambda _event: True)
+_CLIENT_EXT = SimpleNamespace(is_our_event=lambda _event: False)
+_DELETE_TRUE_MAIN = SimpleNamespace(delete_event=lambda *_args, **_kwargs: True)
 
+def _event(**fields) -> dict:
+    """Build a one-hour event with fresh nested dicts, plus ``fields``."""
+    return {
+        "start": {"dateTime": "2026-01-01T10:00:00Z"},
+        "end": {"dateTime": "2026-01-01T11:00:00Z"},
+        **fields,
+    }
 
-async def _insert_calendar(user_id: int, token_id: int, calendar_id: str) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO client_calendars
-           (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
-           VALUES (?, ?, ?, ?, TRUE)
-           RETURNING id""",
-        (user_id, token_id, calendar_id, calendar_id),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+
+class _FakeGoogleClient:
+    """Recording stand-in for the per-calendar GoogleCalendarClient."""
+
+    def __init__(self):
+        self._ids = count(1)
+        self.created = []
+        self.updated = []
+        self.deleted = []
+
+    def create_event(self, _calendar_id: str, _event_data: dict):
+        event_id = f"busy-{next(self._ids)}"
+        self.created.append(event_id)
+        return {"id": event_id}
+
+    def update_event(self, _calendar_id: str, event_id: str, _event_data: dict):
+        self.updated.append(event_id)
+        return {"id": event_id}
+
+    def delete_event(self, _calendar_id: str, event_id: str):
+        self.deleted.append(event_id)
+        return True
+
+
+@pytest.fixture(autouse=True)
+def fake_google(monkeypatch):
+    """Route every busy-block client to one shared fake."""
+    fake = _FakeGoogleClient()
+    monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", lambda _token: fake)
+    return fake
 
 
 @pytest.mark.asyncio
-async def test_sync_client_event_to_main_skip_paths(test_db):
+@pytest.mark.parametrize(
+    "client, event",
+    [
+        (
+            _CLIENT_OWNS,
+            _event(id="evt-1"),
+        ),
+        (_CLIENT_EXT, {"id": "evt-2", "status": "cancelled"}),
+    ],
+    ids=["own_event", "cancelled"],
+)
+async def test_sync_client_event_to_main_skip_paths(test_db, client, event):
     """Client-origin sync should skip self-created and cancelled events."""
-    from app.sync.rules import sync_client_event_to_main
-
-    client = async_fake(SimpleNamespace(is_our_event=lambda _event: True))
-    main_client = async_fake(SimpleNamespace())
-    event = {"id": "evt-1", "start": {"dateTime": "2026-01-01T10:00:00Z"}, "end": {"dateTime": "2026-01-01T11:00:00Z"}}
     result = await sync_client_event_to_main(
-        client=client,
-        main_client=main_client,
+        client=async_fake(client),
+        main_client=async_fake(SimpleNamespace()),
         event=event,
         user_id=1,
         client_calendar_id=1,
@@ -75,29 +88,16 @@ async def test_sync_client_event_to_main_skip_paths(test_db):
     )
     assert result == (None, False)
 
-    client = async_fake(SimpleNamespace(is_our_event=lambda _event: False))
-    cancelled = {"id": "evt-2", "status": "cancelled"}
-    result = await sync_client_event_to_main(
-        client=client,
-        main_client=main_client,
-        event=cancelled,
-        user_id=1,
-        client_calendar_id=1,
-        main_calendar_id="main",
-        client_email="user@example.com",
-    )
-    assert result == (None, False)
-
 
 @pytest.mark.asyncio
 async def test_sync_client_event_to_main_create_update_and_failure_paths(test_db):
     """Client-origin sync should create, update, and safely handle create failure."""
-    from app.sync.rules import sync_client_event_to_main
-
-    user_id = await _insert_user()
-    token_id = await _insert_token(user_id, "client@example.com")
-    calendar_id = await _insert_calendar(user_id, token_id, "client-cal-1")
-    db = await get_database()
+    user_id, _, (calendar_id,) = await seed_user(
+        test_db,
+        tokens=("client@example.com",),
+        calendars=((0, "client-cal-1"),),
+    )
+    db = test_db
 
     class FakeMainClient:
         def __init__(self):
@@ -125,17 +125,15 @@ async def test_sync_client_event_to_main_create_update_and_failure_paths(test_db
                 raise RuntimeError("transient network error")
             return {"id": _event_id}
 
-    client = async_fake(SimpleNamespace(is_our_event=lambda _event: False))
+    client = async_fake(_CLIENT_EXT)
     raw_main_client = FakeMainClient()
     main_client = async_fake(raw_main_client)
 
-    event = {
-        "id": "origin-1",
-        "summary": "Client Event",
-        "start": {"dateTime": "2026-01-01T10:00:00Z"},
-        "end": {"dateTime": "2026-01-01T11:00:00Z"},
-        "organizer": {"email": "user@example.com"},
-    }
+    event = _event(
+        id="origin-1",
+        summary="Client Event",
+        organizer={"email": "user@example.com"},
+    )
 
     created_main_id, created_times_changed = await sync_client_event_to_main(
         client=client,
@@ -149,14 +147,6 @@ async def test_sync_client_event_to_main_create_update_and_failure_paths(test_db
     assert created_main_id == "main-1"
     assert created_times_changed is True  # New event — always changed
 
-    cursor = await db.execute(
-        "SELECT main_event_id, user_can_edit FROM event_mappings WHERE user_id = ? AND origin_event_id = ?",
-        (user_id, "origin-1"),
-    )
-    row = await cursor.fetchone()
-    assert row["main_event_id"] == "main-1"
-    assert row["user_can_edit"] == 1
-
     # Existing mapping update path: 404 triggers replacement creation.
     raw_main_client.fail_update_404 = True
     updated_id, updated_times_changed = await sync_client_event_to_main(
@@ -170,11 +160,6 @@ async def test_sync_client_event_to_main_create_update_and_failure_paths(test_db
     )
     assert updated_id == "main-2"
 
-    cursor = await db.execute(
-        "SELECT main_event_id FROM event_mappings WHERE user_id = ? AND origin_event_id = ?",
-        (user_id, "origin-1"),
-    )
-    assert (await cursor.fetchone())["main_event_id"] == "main-2"
     raw_main_client.fail_update_404 = False
 
     # Existing mapping update path: transient error re-raises (no orphaned duplicate).
@@ -204,52 +189,31 @@ async def test_sync_client_event_to_main_create_update_and_failure_paths(test_db
     )
     assert failed_id is None
     assert failed_changed is False
+
+    # The replacement stuck through the transient failure and no mapping exists for origin-fail.
     cursor = await db.execute(
-        "SELECT COUNT(*) FROM event_mappings WHERE user_id = ? AND origin_event_id = ?",
-        (user_id, "origin-fail"),
+        "SELECT origin_event_id, main_event_id, user_can_edit FROM event_mappings WHERE user_id = ?",
+        (user_id,),
     )
-    assert (await cursor.fetchone())[0] == 0
+    by_origin = {row["origin_event_id"]: row for row in await cursor.fetchall()}
+    assert set(by_origin) == {"origin-1"}
+    assert by_origin["origin-1"]["main_event_id"] == "main-2"
+    assert by_origin["origin-1"]["user_can_edit"] == 1
 
 
 @pytest.mark.asyncio
-async def test_sync_main_event_to_clients_create_and_origin_skip_paths(test_db, monkeypatch):
+async def test_sync_main_event_to_clients_create_and_origin_skip_paths(test_db, fake_google):
     """Main-origin and client-origin events should create busy blocks on appropriate calendars."""
-    from app.sync.rules import sync_main_event_to_clients
-
-    user_id = await _insert_user(email="main@example.com", google_user_id="main-google")
-    token_1 = await _insert_token(user_id, "c1@example.com")
-    token_2 = await _insert_token(user_id, "c2@example.com")
-    cal_1 = await _insert_calendar(user_id, token_1, "cal-1")
-    cal_2 = await _insert_calendar(user_id, token_2, "cal-2")
-
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
-    counter = count(1)
-
-    class FakeGoogleClient:
-        def __init__(self, _token: str):
-            pass
-
-        def create_event(self, _calendar_id: str, _event_data: dict):
-            return {"id": f"busy-{next(counter)}"}
-
-        def update_event(self, _calendar_id: str, _event_id: str, _event_data: dict):
-            return {"id": _event_id}
-
-        def delete_event(self, _calendar_id: str, _event_id: str):
-            return True
-
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
-    monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FakeGoogleClient)
+    user_id, _, (cal_1, cal_2) = await seed_user(
+        test_db,
+        email="main@example.com",
+        google_user_id="main-google",
+        tokens=("c1@example.com", "c2@example.com"),
+        calendars=((0, "cal-1"), (1, "cal-2")),
+    )
 
-    main_client = async_fake(SimpleNamespace(is_our_event=lambda _event: False))
-    event = {
-        "id": "main-evt-1",
-        "status": "confirmed",
-        "start": {"dateTime": "2026-01-01T10:00:00Z"},
-        "end": {"dateTime": "2026-01-01T11:00:00Z"},
-    }
+    main_client = async_fake(_CLIENT_EXT)
+    event = _event(id="main-evt-1", status="confirmed")
 
     created = await sync_main_event_to_clients(
         main_client=main_client,
@@ -260,12 +224,7 @@ async def test_sync_main_event_to_clients_create_and_origin_skip_paths(test_db,
     )
     assert len(created) == 2
 
-    db = await get_database()
-    cursor = await db.execute(
-        "SELECT COUNT(*) FROM busy_blocks"
-    )
-    assert (await cursor.fetchone())[0] == 2
-
+    db = test_db
     # Client-origin mapping should skip origin calendar and only block other calendars.
     cursor = await db.execute(
         """INSERT INTO event_mappings
@@ -285,110 +244,108 @@ async def test_sync_main_event_to_clients_create_and_origin_skip_paths(test_db,
         user_email="main@example.com",
     )
     assert len(created_for_client_origin) == 1
+    assert fake_google.created == created + created_for_client_origin
 
-    cursor = await db.execute(
-        "SELECT client_calendar_id FROM busy_blocks WHERE event_mapping_id = ?",
-        (mapping_id,),
-    )
+    cursor = await db.execute("SELECT event_mapping_id, client_calendar_id FROM busy_blocks")
     rows = await cursor.fetchall()
-    assert len(rows) == 1
-    assert rows[0]["client_calendar_id"] == cal_2
+    assert sum(1 for row in rows if row["event_mapping_id"] != mapping_id) == 2
+    assert [row["client_calendar_id"] for row in rows if row["event_mapping_id"] == mapping_id] == [cal_2]
 
 
 @pytest.mark.asyncio
-async def test_sync_main_event_to_clients_skip_and_existing_update_paths(test_db, monkeypatch):
-    """Main-to-client sync should skip non-blocking events and update existing mappings."""
-    from app.sync.rules import sync_main_event_to_clients
-
-    user_id = await _insert_user(email="u@example.com", google_user_id="u-google")
-    token = await _insert_token(user_id, "c1@example.com")
-    cal_1 = await _insert_calendar(user_id, token, "cal-1")
-
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
-    class FakeGoogleClient:
-        def __init__(self, _token: str):
-            self.updated = []
-
-        def create_event(self, _calendar_id: str, _event_data: dict):
-            return {"id": "busy-created"}
-
-        def update_event(self, _calendar_id: str, _event_id: str, _event_data: dict):
-            self.updated.append(_event_id)
-            return {"id": _event_id}
-
-        def delete_event(self, _calendar_id: str, _event_id: str):
-            return True
+@pytest.mark.parametrize(
+    "event",
+    [
+        {
+            "id": "main-2",
+            "status": "confirmed",
+            "start": {"date": "2026-01-01"},
+            "end": {"date": "2026-01-02"},
+            "transparency": "transparent",
+        },
+        {"id": "main-cancelled", "status": "cancelled"},
+    ],
+    ids=["non_blocking", "cancelled"],
+)
+async def test_sync_main_event_to_clients_skip_paths(test_db, fake_google, event):
+    """Main-to-client sync should not create busy blocks for non-blocking events."""
+    # Seed a real client calendar so a missed skip would create a busy block.
+    user_id, _, _ = await seed_user(
+        test_db,
+        email="u@example.com",
+        google_user_id="u-google",
+        tokens=("c1@example.com",),
+        calendars=((0, "cal-1"),),
+    )
+    created = await sync_main_event_to_clients(
+        main_client=async_fake(_CLIENT_EXT),
+        event=event,
+        user_id=user_id,
+        main_calendar_id="main",
+        user_email="u@example.com",
+    )
+    assert created == []
+    assert fake_google.created == []
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
-    monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FakeGoogleClient)
 
-    # Skip non-blocking event.
-    main_client = async_fake(SimpleNamespace(is_our_event=lambda _event: False))
-    assert (
-        await sync_main_event_to_clients(
-            main_client=main_client,
-            event={
-                "id": "main-2",
-                "status": "confirmed",
-                "start": {"date": "2026-01-01"},
-                "end": {"date": "2026-01-02"},
-                "transparency": "transparent",
-            },
-            user_id=user_id,
-            main_calendar_id="main",
-            user_email="u@example.com",
-        )
-        == []
+@pytest.mark.asyncio
+async def test_sync_main_event_to_clients_existing_update_paths(test_db, fake_google):
+    """Main-to-client sync should leave existing mappings alone when times are unchanged."""
+    user_id, _, (cal_1,) = await seed_user(
+        test_db,
+        email="u@example.com",
+        google_user_id="u-google",
+        tokens=("c1@example.com",),
+        calendars=((0, "cal-1"),),
     )
 
+    main_client = async_fake(_CLIENT_EXT)
+
     # Existing mapping + existing busy block update path (times unchanged → skip).
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO event_mappings
+    db = test_db
+    # SQLite has no data-modifying CTEs, so chain the busy block on last_insert_rowid().
+    await db.executescript(
+        f"""BEGIN;
+           INSERT INTO event_mappings
            (user_id, origin_type, origin_event_id, main_event_id,
             event_start, event_end, is_all_day, is_recurring, user_can_edit)
-           VALUES (?, 'main', ?, ?, ?, ?, FALSE, FALSE, TRUE)
-           RETURNING id""",
-        (user_id, "main-3", "main-3", "2026-01-01T10:00:00Z", "2026-01-01T11:00:00Z"),
-    )
-    mapping_id = (await cursor.fetchone())["id"]
-    await db.execute(
-        "INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id) VALUES (?, ?, ?)",
-        (mapping_id, cal_1, "busy-old"),
+           VALUES ({user_id}, 'main', 'main-3', 'main-3',
+                   '2026-01-01T10:00:00Z', '2026-01-01T11:00:00Z', FALSE, FALSE, TRUE);
+           INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id)
+           VALUES (last_insert_rowid(), {cal_1}, 'busy-old');
+           COMMIT;"""
     )
-    await db.commit()
 
     created = await sync_main_event_to_clients(
         main_client=main_client,
-        event={
-            "id": "main-3",
-            "status": "confirmed",
-            "start": {"dateTime": "2026-01-01T10:00:00Z"},
-            "end": {"dateTime": "2026-01-01T11:00:00Z"},
-        },
+        event=_event(id="main-3", status="confirmed"),
         user_id=user_id,
         main_calendar_id="main",
         user_email="u@example.com",
     )
     assert created == []
+    assert fake_google.updated == []
 
-    cursor = await db.execute("SELECT event_start, event_end FROM event_mappings WHERE id = ?", (mapping_id,))
+    cursor = await db.execute(
+        "SELECT event_start, event_end FROM event_mappings WHERE user_id = ? AND main_event_id = 'main-3'",
+        (user_id,),
+    )
     row = await cursor.fetchone()
     assert row["event_start"] == "2026-01-01T10:00:00Z"
     assert row["event_end"] == "2026-01-01T11:00:00Z"
 
 
 @pytest.mark.asyncio
-async def test_handle_deleted_client_event_paths(test_db, monkeypatch):
+async def test_handle_deleted_client_event_paths(test_db, fake_google):
     """Deleted client events should clean up mappings and busy blocks safely."""
-    from app.sync.rules import handle_deleted_client_event
-
-    user_id = await _insert_user(email="del@example.com", google_user_id="del-google")
-    token = await _insert_token(user_id, "client@example.com")
-    cal_id = await _insert_calendar(user_id, token, "cal-del")
-    db = await get_database()
+    user_id, _, (cal_id,) = await seed_user(
+        test_db,
+        email="del@example.com",
+        google_user_id="del-google",
+        tokens=("client@example.com",),
+        calendars=((0, "cal-del"),),
+    )
+    db = test_db
 
     # No mapping -> no-op
     await handle_deleted_client_event(
@@ -396,7 +353,7 @@ async def test_handle_deleted_client_event_paths(test_db, monkeypatch):
         client_calendar_id=cal_id,
         event_id="missing",
         main_calendar_id="main",
-        main_client=async_fake(SimpleNamespace(delete_event=lambda *_args, **_kwargs: True)),
+        main_client=async_fake(_DELETE_TRUE_MAIN),
     )
 
     # Non-recurring -> hard delete mapping
@@ -408,35 +365,22 @@ async def test_handle_deleted_client_event_paths(test_db, monkeypatch):
         (user_id, cal_id, "origin-1", "main-1"),
     )
     mapping_id = (await cursor.fetchone())["id"]
-    await db.execute(
-        "INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id) VALUES (?, ?, ?)",
-        (mapping_id, cal_id, "busy-1"),
+    await db.executescript(
+        "INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id) "
+        f"VALUES ({mapping_id}, {cal_id}, 'busy-1');"
     )
-    await db.commit()
-
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
-    class FakeGC:
-        def __init__(self, _token: str):
-            pass
-
-        def delete_event(self, _calendar_id: str, _event_id: str):
-            return True
-
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
-    monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FakeGC)
 
     await handle_deleted_client_event(
         user_id=user_id,
         client_calendar_id=cal_id,
         event_id="origin-1",
         main_calendar_id="main",
-        main_client=async_fake(SimpleNamespace(delete_event=lambda *_args, **_kwargs: True)),
+        main_client=async_fake(_DELETE_TRUE_MAIN),
     )
 
     cursor = await db.execute("SELECT COUNT(*) FROM event_mappings WHERE id = ?", (mapping_id,))
     assert (await cursor.fetchone())[0] == 0
+    assert fake_google.deleted == ["busy-1"]
 
     # Recurring -> soft delete mapping
     cursor = await db.execute(
@@ -454,21 +398,23 @@ async def test_handle_deleted_client_event_paths(test_db, monkeypatch):
         client_calendar_id=cal_id,
         event_id="origin-2",
         main_calendar_id="main",
-        main_client=async_fake(SimpleNamespace(delete_event=lambda *_args, **_kwargs: True)),
+        main_client=async_fake(_DELETE_TRUE_MAIN),
     )
     cursor = await db.execute("SELECT deleted_at FROM event_mappings WHERE id = ?", (recurring_id,))
     assert (await cursor.fetchone())["deleted_at"] is not None
 
 
 @pytest.mark.asyncio
-async def test_handle_deleted_main_event_paths(test_db, monkeypatch):
+async def test_handle_deleted_main_event_paths(test_db, fake_google):
     """Deleted main events should clean up client-origin links and busy blocks."""
-    from app.sync.rules import handle_deleted_main_event
-
-    user_id = await _insert_user(email="main-del@example.com", google_user_id="main-del-google")
-    token = await _insert_token(user_id, "client-origin@example.com")
-    cal_id = await _insert_calendar(user_id, token, "cal-origin")
-    db = await get_database()
+    user_id, _, (cal_id,) = await seed_user(
+        test_db,
+        email="main-del@example.com",
+        google_user_id="main-del-google",
+        tokens=("client-origin@example.com",),
+        calendars=((0, "cal-origin"),),
+    )
+    db = test_db
 
     # No mapping -> no-op
     await handle_deleted_main_event(user_id=user_id, event_id="missing-main")
@@ -481,24 +427,10 @@ async def test_handle_deleted_main_event_paths(test_db, monkeypatch):
         (user_id, cal_id, "origin-client-event", "main-event-1"),
     )
     mapping_id = (await cursor.fetchone())["id"]
-    await db.execute(
-        "INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id) VALUES (?, ?, ?)",
-        (mapping_id, cal_id, "busy-main-1"),
+    await db.executescript(
+        "INSERT INTO busy_blocks (event_mapping_id, client_calendar_id, busy_block_event_id) "
+        f"VALUES ({mapping_id}, {cal_id}, 'busy-main-1');"
     )
-    await db.commit()
-
-    async def fake_get_valid_access_token(_user_id: int, _email: str) -> str:
-        return "token"
-
-    class FakeGC:
-        def __init__(self, _token: str):
-            pass
-
-        def delete_event(self, _calendar_id: str, _event_id: str):
-            return True
-
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
-    monkeypatch.setattr("app.sync.google_calendar.GoogleCalendarClient", FakeGC)
 
     await handle_deleted_main_event(user_id=user_id, event_id="main-event-1")
 
@@ -2,13 +2,20 @@
 
 from __future__ import annotations
 
-from datetime import datetime
 from types import SimpleNamespace
 
 import pytest
 from starlette.requests import Request
 
-from app.database import get_database
+from app.ui.routes import (
+    admin_logs,
+    admin_settings,
+    admin_user_detail,
+    admin_users,
+    index,
+    logs_page,
+)
+from tests.conftest import seed_user
 
 
 def _request(path: str) -> Request:
@@ -21,50 +28,33 @@ def _request(path: str) -> Request:
     return Request(scope)
 
 
+# The routes never mutate the request, so one Request per path is shared.
+_REQ_INDEX = _request("/")
+_REQ_LOGS = _request("/app/logs")
+_REQ_ADMIN_USERS = _request("/admin/users")
+_REQ_ADMIN_USER_DETAIL = _request("/admin/users/1")
+_REQ_ADMIN_LOGS = _request("/admin/logs")
+_REQ_ADMIN_SETTINGS = _request("/admin/settings")
+
+# Nothing asserts on users.created_at, so every seeded user shares one value.
+_FIXED_CREATED_AT = "2024-01-01T00:00:00"
+
+_INSERT_USER_SQL = """INSERT INTO users (email, google_user_id, display_name, is_admin, main_calendar_id, created_at)
+   VALUES (?, ?, ?, ?, ?, ?)"""
+
+
 async def _insert_user(
+    db,
     email: str,
     google_user_id: str,
     is_admin: bool = False,
     main_calendar_id: str | None = None,
 ) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO users (email, google_user_id, display_name, is_admin, main_calendar_id, created_at)
-           VALUES (?, ?, ?, ?, ?, ?)
-           RETURNING id""",
-        (email, google_user_id, email.split("@")[0], is_admin, main_calendar_id, datetime.utcnow().isoformat()),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
-
-
-async def _insert_token(user_id: int, email: str) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO oauth_tokens
-           (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
-           VALUES (?, 'client', ?, ?, ?)
-           RETURNING id""",
-        (user_id, email, b"a", b"r"),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
-
-
-async def _insert_calendar(user_id: int, token_id: int, calendar_id: str) -> int:
-    db = await get_database()
     cursor = await db.execute(
-        """INSERT INTO client_calendars
-           (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
-           VALUES (?, ?, ?, ?, TRUE)
-           RETURNING id""",
-        (user_id, token_id, calendar_id, calendar_id),
+        _INSERT_USER_SQL,
+        (email, google_user_id, email.split("@")[0], is_admin, main_calendar_id, _FIXED_CREATED_AT),
     )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
 def _user(id_: int, email: str, is_admin: bool = False, main_calendar_id: str | None = None):
@@ -80,13 +70,11 @@ def _user(id_: int, email: str, is_admin: bool = False, main_calendar_id: str |
 @pytest.mark.asyncio
 async def test_index_oobe_completed_redirects_to_app(test_db, monkeypatch):
     """Index route should redirect to /app when OOBE is complete."""
-    from app.ui.routes import index
-
     async def oobe_true():
         return True
 
     monkeypatch.setattr("app.ui.routes.is_oobe_completed", oobe_true)
-    response = await index(_request("/"))
+    response = await index(_REQ_INDEX)
     assert response.status_code == 302
     assert response.headers["location"] == "/app"
 
@@ -94,13 +82,15 @@ async def test_index_oobe_completed_redirects_to_app(test_db, monkeypatch):
 @pytest.mark.asyncio
 async def test_logs_page_calendar_and_status_filters(test_db, monkeypatch):
     """Logs page should apply optional calendar and status filters."""
-    from app.ui.routes import logs_page
-
-    user_id = await _insert_user("ui-filter@example.com", "ui-filter-google", main_calendar_id="main")
-    token_id = await _insert_token(user_id, "ui-filter-client@example.com")
-    cal_1 = await _insert_calendar(user_id, token_id, "ui-filter-cal-1")
-    cal_2 = await _insert_calendar(user_id, token_id, "ui-filter-cal-2")
-    db = await get_database()
+    user_id, _, (cal_1, cal_2) = await seed_user(
+        test_db,
+        "ui-filter@example.com",
+        "ui-filter-google",
+        main_calendar_id="main",
+        tokens=("ui-filter-client@example.com",),
+        calendars=((0, "ui-filter-cal-1"), (0, "ui-filter-cal-2")),
+    )
+    db = test_db
     await db.execute(
         """INSERT INTO sync_log (user_id, calendar_id, action, status, details)
            VALUES (?, ?, 'sync', 'success', '{}')""",
@@ -119,7 +109,7 @@ async def test_logs_page_calendar_and_status_filters(test_db, monkeypatch):
     monkeypatch.setattr("app.ui.routes.get_current_user_optional", auth_user)
 
     response = await logs_page(
-        _request("/app/logs"),
+        _REQ_LOGS,
         page=1,
         calendar_id=cal_2,
         status_filter="failure",
@@ -130,14 +120,39 @@ async def test_logs_page_calendar_and_status_filters(test_db, monkeypatch):
     assert response.context["status_filter"] == "failure"
 
 
+@pytest.fixture
+def normal_user_ctx(monkeypatch):
+    """Authenticate every ui.routes request as a non-admin user."""
+
+    async def normal_user(_request):
+        return _user(2, "ui-normal@example.com", is_admin=False, main_calendar_id="main")
+
+    monkeypatch.setattr("app.ui.routes.get_current_user_optional", normal_user)
+
+
 @pytest.mark.asyncio
-async def test_admin_page_auth_redirects_and_user_filter(test_db, monkeypatch):
-    """Admin pages should redirect non-admin users and apply user filter in admin logs."""
-    from app.ui.routes import admin_logs, admin_settings, admin_user_detail, admin_users
+@pytest.mark.parametrize(
+    "route, request_, extra_kwargs",
+    [
+        (admin_users, _REQ_ADMIN_USERS, {}),
+        (admin_user_detail, _REQ_ADMIN_USER_DETAIL, {"user_id": 1}),
+        (admin_logs, _REQ_ADMIN_LOGS, {"user_id": 2}),
+        (admin_settings, _REQ_ADMIN_SETTINGS, {}),
+    ],
+    ids=["users", "user_detail", "logs", "settings"],
+)
+async def test_admin_pages_redirect_non_admin(test_db, normal_user_ctx, route, request_, extra_kwargs):
+    """Admin pages should redirect non-admin users back to the app."""
+    response = await route(request_, **extra_kwargs)
+    assert response.headers["location"] == "/app"
+
 
-    admin_id = await _insert_user("ui-admin@example.com", "ui-admin-google", is_admin=True, main_calendar_id="main")
-    user_id = await _insert_user("ui-normal@example.com", "ui-normal-google", is_admin=False, main_calendar_id="main")
-    db = await get_database()
+@pytest.mark.asyncio
+async def test_admin_logs_user_filter(test_db, monkeypatch):
+    """Admin logs should apply the optional user filter."""
+    admin_id = await _insert_user(test_db, "ui-admin@example.com", "ui-admin-google", is_admin=True, main_calendar_id="main")
+    user_id = await _insert_user(test_db, "ui-normal@example.com", "ui-normal-google", is_admin=False, main_calendar_id="main")
+    db = test_db
     await db.execute(
         """INSERT INTO sync_log (user_id, action, status, details)
            VALUES (?, 'sync', 'failure', '{}')""",
@@ -145,19 +160,10 @@ async def test_admin_page_auth_redirects_and_user_filter(test_db, monkeypatch):
     )
     await db.commit()
 
-    async def normal_user(_request):
-        return _user(user_id, "ui-normal@example.com", is_admin=False, main_calendar_id="main")
-
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", normal_user)
-    assert (await admin_users(_request("/admin/users"))).headers["location"] == "/app"
-    assert (await admin_user_detail(_request("/admin/users/1"), user_id=1)).headers["location"] == "/app"
-    assert (await admin_logs(_request("/admin/logs"), user_id=user_id)).headers["location"] == "/app"
-    assert (await admin_settings(_request("/admin/settings"))).headers["location"] == "/app"
-
     async def admin_user(_request):
         return _user(admin_id, "ui-admin@example.com", is_admin=True, main_calendar_id="main")
 
     monkeypatch.setattr("app.ui.routes.get_current_user_optional", admin_user)
-    filtered = await admin_logs(_request("/admin/logs"), user_id=user_id, page=1)
+    filtered = await admin_logs(_REQ_ADMIN_LOGS, user_id=user_id, page=1)
     assert filtered.status_code == 200
     assert filtered.context["user_id"] == user_id
@@ -2,16 +2,36 @@
 
 from __future__ import annotations
 
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import lru_cache
 from types import SimpleNamespace
 
 import pytest
+from googleapiclient import discovery as _discovery
 from starlette.requests import Request
 
-from app.database import get_database, set_setting
-
-
+from app.auth import google as _auth_google
+from app.database import get_database
+from app.ui import routes as _ui_routes
+from app.ui.routes import (
+    admin_dashboard,
+    admin_logs,
+    admin_settings,
+    admin_user_detail,
+    admin_users,
+    dashboard,
+    index,
+    login_page,
+    logs_page,
+    select_calendar_page,
+    settings_page,
+)
+
+
+@lru_cache(maxsize=None)
 def _request(path: str) -> Request:
+    """Return one shared Request per path; the routes never read the body or mutate it."""
     scope = {
         "type": "http",
         "method": "GET",
@@ -22,81 +42,118 @@ def _request(path: str) -> Request:
 
 
 async def _insert_user(
+    db,
     email: str,
     google_user_id: str,
     is_admin: bool = False,
     main_calendar_id: str | None = None,
 ) -> int:
-    db = await get_database()
+    now = datetime.now(timezone.utc).isoformat()
     cursor = await db.execute(
         """INSERT INTO users (email, google_user_id, display_name, is_admin, main_calendar_id, created_at, last_login_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)
-           RETURNING id""",
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
         (
             email,
             google_user_id,
             email.split("@")[0],
             is_admin,
             main_calendar_id,
-            datetime.utcnow().isoformat(),
-            datetime.utcnow().isoformat(),
+            now,
+            now,
         ),
     )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
-async def _insert_token(user_id: int, account_type: str, email: str) -> int:
-    db = await get_database()
+async def _insert_token(db, user_id: int, account_type: str, email: str) -> int:
     cursor = await db.execute(
         """INSERT INTO oauth_tokens
            (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
-           VALUES (?, ?, ?, ?, ?)
-           RETURNING id""",
+           VALUES (?, ?, ?, ?, ?)""",
         (user_id, account_type, email, b"a", b"r"),
     )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
-async def _insert_calendar(user_id: int, token_id: int, calendar_id: str, is_active: bool = True) -> int:
-    db = await get_database()
+async def _insert_calendar(db, user_id: int, token_id: int, calendar_id: str, is_active: bool = True) -> int:
     cursor = await db.execute(
         """INSERT INTO client_calendars
            (user_id, oauth_token_id, google_calendar_id, display_name, is_active)
-           VALUES (?, ?, ?, ?, ?)
-           RETURNING id""",
+           VALUES (?, ?, ?, ?, ?)""",
         (user_id, token_id, calendar_id, calendar_id, is_active),
     )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
-def _user(id_: int, email: str, is_admin: bool = False, main_calendar_id: str | None = None):
-    return SimpleNamespace(
-        id=id_,
-        email=email,
-        is_admin=is_admin,
-        display_name=email.split("@")[0],
-        main_calendar_id=main_calendar_id,
-    )
+_CALENDARS_RESPONSE = {
+    "items": [
+        {"id": "c1", "summary": "Cal 1", "accessRole": "owner"},
+        {"id": "c2", "summary": "Cal 2", "accessRole": "reader"},
+    ]
+}
+
+
+class _FakeService:
+    """Calendar API stand-in whose calendarList().list().execute() chain is built once."""
+
+    _list = SimpleNamespace(execute=lambda: _CALENDARS_RESPONSE)
+    _calendar_list = SimpleNamespace(list=lambda: _FakeService._list)
+
+    def calendarList(self):
+        return self._calendar_list
+
+
+def _fake_build(*_args, **_kwargs):
+    return _FakeService()
+
+
+def _stub_template_response(_request, _name, context=None, **_kwargs):
+    return SimpleNamespace(status_code=200, context=context, headers={})
+
+
+def _stub_templates(monkeypatch):
+    """Skip Jinja rendering for repeat renders whose body is never asserted.
+
+    Call it only after the template has been rendered for real once in the test.
+    """
+    monkeypatch.setattr(_ui_routes.templates, "TemplateResponse", _stub_template_response)
+
+
+@dataclass(slots=True, frozen=True)
+class _PageUser:
+    """Authenticated user as the UI routes see it."""
+
+    id: int
+    email: str
+    is_admin: bool = False
+    main_calendar_id: str | None = None
+
+    @property
+    def display_name(self) -> str:
+        return self.email.split("@")[0]
+
+
+async def _no_user(_request):
+    return None
+
+
+_NORMAL_USER = _PageUser(2, "normal-ui@example.com", main_calendar_id="main-user")
+
+
+async def _normal_user(_request):
+    return _NORMAL_USER
 
 
 @pytest.mark.asyncio
 async def test_index_dashboard_and_login_page_paths(test_db, monkeypatch):
     """Index/dashboard/login routes should redirect correctly and render when authenticated."""
-    from app.ui.routes import dashboard, index, login_page
-
     async def oobe_false():
         return False
 
     async def oobe_true():
         return True
 
-    monkeypatch.setattr("app.ui.routes.is_oobe_completed", oobe_false)
+    monkeypatch.setattr(_ui_routes, "is_oobe_completed", oobe_false)
     idx = await index(_request("/"))
     assert idx.status_code == 302
     assert idx.headers["location"] == "/setup"
@@ -107,40 +164,46 @@ async def test_index_dashboard_and_login_page_paths(test_db, monkeypatch):
     login_setup = await login_page(_request("/app/login"))
     assert login_setup.headers["location"] == "/setup"
 
-    monkeypatch.setattr("app.ui.routes.is_oobe_completed", oobe_true)
+    monkeypatch.setattr(_ui_routes, "is_oobe_completed", oobe_true)
 
-    async def no_user(_request):
-        return None
-
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", no_user)
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", _no_user)
     dash_login = await dashboard(_request("/app"))
     assert dash_login.headers["location"] == "/app/login"
 
-    # Authenticated dashboard render
-    user_id = await _insert_user("ui-user@example.com", "ui-google", main_calendar_id="main")
+    # Authenticated dashboard render: seed every row in one transaction.
     db = await get_database()
-    token_id = await _insert_token(user_id, "client", "ui-client@example.com")
-    cal_id = await _insert_calendar(user_id, token_id, "ui-cal")
-    await db.execute(
-        "INSERT INTO calendar_sync_state (client_calendar_id, consecutive_failures) VALUES (?, ?)",
-        (cal_id, 0),
-    )
-    await db.execute(
-        """INSERT INTO event_mappings
-           (user_id, origin_type, origin_calendar_id, origin_event_id, main_event_id, is_recurring, user_can_edit)
-           VALUES (?, 'client', ?, 'e1', 'm1', FALSE, TRUE)""",
-        (user_id, cal_id),
-    )
-    await db.execute(
-        "INSERT INTO organization (google_workspace_domain, google_client_id_encrypted, google_client_secret_encrypted) VALUES (?, ?, ?)",
-        ("example.com", b"x", b"y"),
-    )
+    await db.execute("BEGIN")
+    try:
+        user_id = await _insert_user(db, "ui-user@example.com", "ui-google", main_calendar_id="main")
+        token_id = await _insert_token(db, user_id, "client", "ui-client@example.com")
+        cal_id = await _insert_calendar(db, user_id, token_id, "ui-cal")
+        await db.execute(
+            "INSERT INTO calendar_sync_state (client_calendar_id, consecutive_failures) VALUES (?, 0)",
+            (cal_id,),
+        )
+        await db.execute(
+            """INSERT INTO event_mappings
+               (user_id, origin_type, origin_calendar_id, origin_event_id, main_event_id, is_recurring, user_can_edit)
+               VALUES (?, 'client', ?, 'e1', 'm1', FALSE, TRUE)""",
+            (user_id, cal_id),
+        )
+        await db.execute(
+            """INSERT INTO organization
+               (google_workspace_domain, google_client_id_encrypted, google_client_secret_encrypted)
+               VALUES (?, ?, ?)""",
+            ("example.com", b"x", b"y"),
+        )
+    except BaseException:
+        await db.rollback()
+        raise
     await db.commit()
 
+    ui_user = _PageUser(user_id, "ui-user@example.com", main_calendar_id="main")
+
     async def auth_user(_request):
-        return _user(user_id, "ui-user@example.com", main_calendar_id="main")
+        return ui_user
 
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", auth_user)
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", auth_user)
     dash_render = await dashboard(_request("/app"))
     assert dash_render.status_code == 200
     assert dash_render.context["event_count"] >= 1
@@ -151,14 +214,16 @@ async def test_index_dashboard_and_login_page_paths(test_db, monkeypatch):
     assert login_auth.headers["location"] == "/app"
 
     # login page unauthenticated shows org domain
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", no_user)
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", _no_user)
     login_render = await login_page(_request("/app/login"))
     assert login_render.status_code == 200
     assert login_render.context["required_domain"] == "example.com"
 
-    monkeypatch.setattr("app.ui.routes.get_settings", lambda: SimpleNamespace(test_mode=True))
+    # login.html was rendered for real above; the test-mode branch only needs its context.
+    _stub_templates(monkeypatch)
+    monkeypatch.setattr(_ui_routes, "get_settings", lambda: SimpleNamespace(test_mode=True))
     monkeypatch.setattr(
-        "app.ui.routes.get_test_mode_home_allowlist",
+        _ui_routes, "get_test_mode_home_allowlist",
         lambda: {"test-a@gmail.com", "test-b@gmail.com"},
     )
     login_test_mode = await login_page(_request("/app/login"))
@@ -174,16 +239,12 @@ async def test_index_dashboard_and_login_page_paths(test_db, monkeypatch):
 @pytest.mark.asyncio
 async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
     """Settings/log/select-calendar routes should handle auth and external API outcomes."""
-    from app.ui.routes import logs_page, select_calendar_page, settings_page
-
-    user_id = await _insert_user("pages@example.com", "pages-google", main_calendar_id="main")
-    user_obj = _user(user_id, "pages@example.com", main_calendar_id="main")
     db = await get_database()
+    user_id = await _insert_user(db, "pages@example.com", "pages-google", main_calendar_id="main")
+    user_obj = _PageUser(user_id, "pages@example.com", main_calendar_id="main")
+    await db.commit()
 
-    async def no_user(_request):
-        return None
-
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", no_user)
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", _no_user)
     assert (await settings_page(_request("/app/settings"))).headers["location"] == "/app/login"
     assert (await logs_page(_request("/app/logs"))).headers["location"] == "/app/login"
     assert (await select_calendar_page(_request("/app/calendars/select"), token_id=1, email="x")).headers["location"] == "/app/login"
@@ -191,27 +252,14 @@ async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
     async def auth_user(_request):
         return user_obj
 
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", auth_user)
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", auth_user)
 
     # settings page success
     async def fake_get_valid_access_token(_user_id: int, _email: str):
         return "token"
 
-    class FakeService:
-        def calendarList(self):
-            return SimpleNamespace(
-                list=lambda: SimpleNamespace(
-                    execute=lambda: {
-                        "items": [
-                            {"id": "c1", "summary": "Cal 1", "accessRole": "owner"},
-                            {"id": "c2", "summary": "Cal 2", "accessRole": "reader"},
-                        ]
-                    }
-                )
-            )
-
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
-    monkeypatch.setattr("googleapiclient.discovery.build", lambda *_args, **_kwargs: FakeService())
+    monkeypatch.setattr(_auth_google, "get_valid_access_token", fake_get_valid_access_token)
+    monkeypatch.setattr(_discovery, "build", _fake_build)
     settings_ok = await settings_page(_request("/app/settings"))
     assert settings_ok.status_code == 200
     assert len(settings_ok.context["calendars"]) == 2
@@ -220,14 +268,14 @@ async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
     async def failing_token(_user_id: int, _email: str):
         raise RuntimeError("no token")
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", failing_token)
+    monkeypatch.setattr(_auth_google, "get_valid_access_token", failing_token)
     settings_fail = await settings_page(_request("/app/settings"))
     assert settings_fail.status_code == 200
     assert settings_fail.context["calendars"] == []
 
     # logs page render
-    token_id = await _insert_token(user_id, "client", "pages-client@example.com")
-    cal_id = await _insert_calendar(user_id, token_id, "pages-cal")
+    token_id = await _insert_token(db, user_id, "client", "pages-client@example.com")
+    cal_id = await _insert_calendar(db, user_id, token_id, "pages-cal")
     await db.execute(
         """INSERT INTO sync_log (user_id, calendar_id, action, status, details)
            VALUES (?, ?, 'sync', 'success', '{}')""",
@@ -244,7 +292,7 @@ async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
     assert "invalid_token" in invalid_select.headers["location"]
 
     # valid token and calendar fetch/filter
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", fake_get_valid_access_token)
+    monkeypatch.setattr(_auth_google, "get_valid_access_token", fake_get_valid_access_token)
     select_ok = await select_calendar_page(
         _request("/app/calendars/select"),
         token_id=token_id,
@@ -254,7 +302,7 @@ async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
     # Filtered to owner/writer only.
     assert len(select_ok.context["calendars"]) == 1
 
-    monkeypatch.setattr("app.auth.google.get_valid_access_token", failing_token)
+    monkeypatch.setattr(_auth_google, "get_valid_access_token", failing_token)
     select_fail = await select_calendar_page(
         _request("/app/calendars/select"),
         token_id=token_id,
@@ -264,57 +312,46 @@ async def test_settings_logs_and_calendar_select_paths(test_db, monkeypatch):
 
 
 @pytest.mark.asyncio
-async def test_admin_ui_pages(test_db, monkeypatch):
-    """Admin UI pages should enforce auth/admin and render expected data."""
-    from app.ui.routes import (
-        admin_dashboard,
-        admin_logs,
-        admin_settings,
-        admin_user_detail,
-        admin_users,
-    )
+@pytest.mark.parametrize(
+    "auth, expected_location",
+    [(_no_user, "/app/login"), (_normal_user, "/app")],
+    ids=["anonymous", "non_admin"],
+)
+async def test_admin_dashboard_auth_redirects(test_db, monkeypatch, auth, expected_location):
+    """Admin dashboard should send anonymous users to login and non-admins to the app."""
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", auth)
+    assert (await admin_dashboard(_request("/admin"))).headers["location"] == expected_location
+
 
-    admin_id = await _insert_user("admin-ui@example.com", "admin-ui-google", is_admin=True, main_calendar_id="main-admin")
-    user_id = await _insert_user("normal-ui@example.com", "normal-ui-google", is_admin=False, main_calendar_id="main-user")
+@pytest.mark.asyncio
+async def test_admin_ui_pages(test_db, monkeypatch):
+    """Admin UI pages should render expected data for an admin."""
     db = await get_database()
-    token_id = await _insert_token(user_id, "client", "normal-client@example.com")
-    cal_id = await _insert_calendar(user_id, token_id, "normal-cal")
-    await db.execute(
-        "INSERT INTO calendar_sync_state (client_calendar_id, consecutive_failures) VALUES (?, ?)",
-        (cal_id, 1),
+    admin_id = await _insert_user(db, "admin-ui@example.com", "admin-ui-google", is_admin=True, main_calendar_id="main-admin")
+    user_id = await _insert_user(db, "normal-ui@example.com", "normal-ui-google", is_admin=False, main_calendar_id="main-user")
+    token_id = await _insert_token(db, user_id, "client", "normal-client@example.com")
+    cal_id = await _insert_calendar(db, user_id, token_id, "normal-cal")
+    await db.executescript(
+        f"""BEGIN;
+            INSERT INTO calendar_sync_state (client_calendar_id, consecutive_failures) VALUES ({cal_id}, 1);
+            INSERT INTO sync_log (user_id, calendar_id, action, status, details)
+            VALUES ({user_id}, {cal_id}, 'sync', 'failure', '{{}}');
+            INSERT INTO alert_queue (alert_type, recipient_email, subject, body)
+            VALUES ('sync_failures', 'ops@example.com', 'subj', 'body');
+            INSERT INTO settings (key, value_plain, is_sensitive)
+            VALUES ('smtp_host', 'smtp.example.com', FALSE), ('sync_paused', 'true', FALSE);
+            COMMIT;"""
     )
-    await db.execute(
-        """INSERT INTO sync_log (user_id, calendar_id, action, status, details)
-           VALUES (?, ?, 'sync', 'failure', '{}')""",
-        (user_id, cal_id),
-    )
-    await db.execute(
-        """INSERT INTO alert_queue (alert_type, recipient_email, subject, body)
-           VALUES ('sync_failures', 'ops@example.com', 'subj', 'body')"""
-    )
-    await set_setting("smtp_host", "smtp.example.com")
-    await set_setting("sync_paused", "true")
-    await db.commit()
-
-    async def no_user(_request):
-        return None
-
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", no_user)
-    assert (await admin_dashboard(_request("/admin"))).headers["location"] == "/app/login"
-
-    async def normal_user(_request):
-        return _user(user_id, "normal-ui@example.com", is_admin=False, main_calendar_id="main-user")
 
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", normal_user)
-    assert (await admin_dashboard(_request("/admin"))).headers["location"] == "/app"
+    admin = _PageUser(admin_id, "admin-ui@example.com", is_admin=True, main_calendar_id="main-admin")
 
     async def admin_user(_request):
-        return _user(admin_id, "admin-ui@example.com", is_admin=True, main_calendar_id="main-admin")
+        return admin
 
-    monkeypatch.setattr("app.ui.routes.get_current_user_optional", admin_user)
-    dashboard = await admin_dashboard(_request("/admin"))
-    assert dashboard.status_code == 200
-    assert dashboard.context["total_users"] >= 2
+    monkeypatch.setattr(_ui_routes, "get_current_user_optional", admin_user)
+    admin_dash = await admin_dashboard(_request("/admin"))
+    assert admin_dash.status_code == 200
+    assert admin_dash.context["total_users"] >= 2
 
     users_page = await admin_users(_request("/admin/users"), search="normal")
     assert users_page.status_code == 200
@@ -2,16 +2,28 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
 from types import SimpleNamespace
 
 import pytest
 from fastapi import HTTPException
+from starlette.datastructures import FormData
 from starlette.requests import Request
 
+from app.auth import google as _auth_google
 from app.database import get_database
+from app.ui import setup as _ui_setup
+from app.ui.setup import setup_step_2, setup_step_5, setup_wizard, step_3_callback
+from tests.conftest import FakeFormRequest
 
 
+_FORM_STEP2 = FormData([("client_id", "good.apps.googleusercontent.com"), ("client_secret", "secret")])
+_FORM_CONFIRMED = FormData([("confirmed", "on")])
+
+
+@lru_cache(maxsize=8)
 def _request(path: str = "/setup") -> Request:
+    """Cached per path; the setup routes never mutate the request."""
     scope = {
         "type": "http",
         "method": "GET",
@@ -21,31 +33,16 @@ def _request(path: str = "/setup") -> Request:
     return Request(scope)
 
 
-class FakeFormRequest:
-    """Minimal request object with async form() for route unit tests."""
-
-    def __init__(self, form_data: dict):
-        self._form_data = form_data
-        self.url = SimpleNamespace(path="/setup")
-
-    async def form(self):
-        return self._form_data
-
-
 @pytest.mark.asyncio
-async def test_setup_step5_existing_key_context_and_step2_completed_guard(test_db, monkeypatch):
+async def test_setup_step5_existing_key_context_and_step2_completed_guard(test_db, monkeypatch, oobe_data):
     """Setup wizard should reuse existing key context and step 2 should reject completed setup."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import setup_step_2, setup_wizard
-
-    setup_module._oobe_data.clear()
-    setup_module._oobe_data["encryption_key"] = b"2" * 32
-    setup_module._oobe_data["encryption_key_b64"] = "existing-key-b64"
+    oobe_data["encryption_key"] = b"2" * 32
+    oobe_data["encryption_key_b64"] = "existing-key-b64"
 
     async def oobe_incomplete():
         return False
 
-    monkeypatch.setattr("app.ui.setup.is_oobe_completed", oobe_incomplete)
+    monkeypatch.setattr(_ui_setup, "is_oobe_completed", oobe_incomplete)
     rendered = await setup_wizard(_request("/setup"), step=5)
     assert rendered.status_code == 200
     assert rendered.context["encryption_key_b64"] == "existing-key-b64"
@@ -53,27 +50,18 @@ async def test_setup_step5_existing_key_context_and_step2_completed_guard(test_d
     async def oobe_complete():
         return True
 
-    monkeypatch.setattr("app.ui.setup.is_oobe_completed", oobe_complete)
+    monkeypatch.setattr(_ui_setup, "is_oobe_completed", oobe_complete)
     with pytest.raises(HTTPException) as exc:
-        await setup_step_2(
-            FakeFormRequest(
-                {
-                    "client_id": "good.apps.googleusercontent.com",
-                    "client_secret": "secret",
-                }
-            )
-        )
+        await setup_step_2(FakeFormRequest(_FORM_STEP2))
     assert exc.value.status_code == 400
 
 
 @pytest.mark.asyncio
-async def test_setup_step5_generates_key_creates_directory_and_sets_alerts_disabled(test_db, monkeypatch, tmp_path):
+async def test_setup_step5_generates_key_creates_directory_and_sets_alerts_disabled(
+    test_db, monkeypatch, tmp_path, oobe_data
+):
     """Step 5 completion should generate key when missing, create key dir, and disable alerts when SMTP off."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import setup_step_5
-
-    setup_module._oobe_data.clear()
-    setup_module._oobe_data.update(
+    oobe_data.update(
         {
             "client_id": "good.apps.googleusercontent.com",
             "client_secret": "secret",
@@ -90,14 +78,15 @@ async def test_setup_step5_generates_key_creates_directory_and_sets_alerts_disab
 
     nested_dir = tmp_path / "nested" / "keys"
     key_path = nested_dir / "enc.key"
-    monkeypatch.setattr("app.ui.setup.get_settings", lambda: SimpleNamespace(encryption_key_file=str(key_path)))
-    monkeypatch.setattr("app.ui.setup.generate_encryption_key", lambda: b"1" * 32)
+    monkeypatch.setattr(_ui_setup, "get_settings", lambda: SimpleNamespace(encryption_key_file=str(key_path)))
+    monkeypatch.setattr(_ui_setup, "generate_encryption_key", lambda: b"1" * 32)
 
-    response = await setup_step_5(FakeFormRequest({"confirmed": "on"}))
+    response = await setup_step_5(FakeFormRequest(_FORM_CONFIRMED))
     assert response.status_code == 302
     assert response.headers["location"] == "/setup?step=6"
-    assert key_path.exists()
-    assert setup_module._oobe_data == {}
+    assert nested_dir.is_dir()
+    assert key_path.read_bytes() == b"1" * 32
+    assert oobe_data == {}
 
     db = await get_database()
     cursor = await db.execute("SELECT value_plain FROM settings WHERE key = 'alerts_enabled'")
@@ -106,13 +95,9 @@ async def test_setup_step5_generates_key_creates_directory_and_sets_alerts_disab
 
 
 @pytest.mark.asyncio
-async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, monkeypatch):
+async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, monkeypatch, oobe_data):
     """Step-3 callback should enforce TEST_MODE home-account allowlist."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import step_3_callback
-
-    setup_module._oobe_data.clear()
-    setup_module._oobe_data.update(
+    oobe_data.update(
         {
             "client_id": "good.apps.googleusercontent.com",
             "client_secret": "secret",
@@ -121,7 +106,7 @@ async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, m
     )
 
     monkeypatch.setattr(
-        "app.ui.setup.get_settings",
+        _ui_setup, "get_settings",
         lambda: SimpleNamespace(public_url="http://localhost:3000", test_mode=True),
     )
 
@@ -131,10 +116,10 @@ async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, m
     async def fake_user_info_blocked(_access):
         return {"email": "blocked@gmail.com", "name": "Blocked", "id": "g-blocked"}
 
-    monkeypatch.setattr("app.auth.google.exchange_code_for_tokens", fake_exchange)
-    monkeypatch.setattr("app.auth.google.get_user_info", fake_user_info_blocked)
+    monkeypatch.setattr(_auth_google, "exchange_code_for_tokens", fake_exchange)
+    monkeypatch.setattr(_auth_google, "get_user_info", fake_user_info_blocked)
 
-    monkeypatch.setattr("app.ui.setup.get_test_mode_home_allowlist", lambda: set())
+    monkeypatch.setattr(_ui_setup, "get_test_mode_home_allowlist", lambda: set())
     missing_allowlist = await step_3_callback(
         _request("/setup/step/3/callback"),
         code="auth-code",
@@ -143,7 +128,7 @@ async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, m
     assert "test_mode_no_home_allowlist" in missing_allowlist.headers["location"]
 
     monkeypatch.setattr(
-        "app.ui.setup.get_test_mode_home_allowlist",
+        _ui_setup, "get_test_mode_home_allowlist",
         lambda: {"allowed@gmail.com"},
     )
     blocked = await step_3_callback(
@@ -156,7 +141,7 @@ async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, m
     async def fake_user_info_allowed(_access):
         return {"email": "allowed@gmail.com", "name": "Allowed", "id": "g-allowed"}
 
-    monkeypatch.setattr("app.auth.google.get_user_info", fake_user_info_allowed)
+    monkeypatch.setattr(_auth_google, "get_user_info", fake_user_info_allowed)
     allowed = await step_3_callback(
         _request("/setup/step/3/callback"),
         code="auth-code",
@@ -164,4 +149,4 @@ async def test_setup_step3_callback_enforces_test_mode_home_allowlist(test_db, m
     )
     assert allowed.status_code == 302
     assert allowed.headers["location"] == "/setup?step=3"
-    assert setup_module._oobe_data["admin_email"] == "allowed@gmail.com"
+    assert oobe_data["admin_email"] == "allowed@gmail.com"
@@ -2,15 +2,53 @@
 
 from __future__ import annotations
 
+from functools import lru_cache
 from types import SimpleNamespace
 
 import pytest
 from starlette.requests import Request
 
 from app.database import get_database
+from app.ui import setup as _ui_setup
+from app.ui.setup import (
+    setup_complete,
+    setup_step_2,
+    setup_step_4,
+    setup_step_5,
+    setup_wizard,
+    step_3_auth,
+    step_3_callback,
+    step_3_confirm,
+)
+from tests.conftest import FakeFormRequest
+
+
+# FormData is immutable and FakeFormRequest.form() hands it back as-is, so
+# each static payload is built once and shared by every test.
+_EMPTY_FORM = FakeFormRequest({})
+_MISSING_CREDS_FORM = FakeFormRequest({"client_id": "", "client_secret": ""})
+_BAD_CLIENT_ID_FORM = FakeFormRequest({"client_id": "not-google-id", "client_secret": "secret"})
+_GOOD_CREDS_FORM = FakeFormRequest({"client_id": "good.apps.googleusercontent.com", "client_secret": "secret"})
+_TEST_CREDS_FORM = FakeFormRequest({"client_id": "good.apps.googleusercontent.com", "client_secret": "s"})
+_STEP4_DISABLED_FORM = FakeFormRequest({"enabled": ""})
+_STEP4_ENABLED_FORM = FakeFormRequest(
+    {
+        "enabled": "on",
+        "smtp_host": "smtp.example.com",
+        "smtp_port": "2525",
+        "smtp_username": "user",
+        "smtp_password": "pass",
+        "from_address": "noreply@example.com",
+        "alert_emails": "ops@example.com",
+    }
+)
+_STEP5_UNCONFIRMED_FORM = FakeFormRequest({"confirmed": ""})
+_STEP5_CONFIRMED_FORM = FakeFormRequest({"confirmed": "on"})
 
 
+@lru_cache(maxsize=8)
 def _request(path: str = "/setup") -> Request:
+    """Return one shared Request per path; setup_wizard renders a template, so a real Request is kept."""
     scope = {
         "type": "http",
         "method": "GET",
@@ -20,25 +58,9 @@ def _request(path: str = "/setup") -> Request:
     return Request(scope)
 
 
-class FakeFormRequest:
-    """Minimal request object with async form() for route unit tests."""
-
-    def __init__(self, form_data: dict):
-        self._form_data = form_data
-        self.url = SimpleNamespace(path="/setup")
-
-    async def form(self):
-        return self._form_data
-
-
 @pytest.mark.asyncio
-async def test_setup_wizard_and_step2_paths(test_db, monkeypatch):
+async def test_setup_wizard_and_step2_paths(test_db, monkeypatch, oobe_data):
     """Setup wizard should redirect when complete and validate step-2 credentials."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import setup_step_2, setup_wizard
-
-    setup_module._oobe_data.clear()
-
     async def oobe_complete():
         return True
 
@@ -53,47 +75,31 @@ async def test_setup_wizard_and_step2_paths(test_db, monkeypatch):
     monkeypatch.setattr("app.ui.setup.is_oobe_completed", oobe_incomplete)
     step5 = await setup_wizard(_request("/setup"), step=5)
     assert step5.status_code == 200
-    assert "encryption_key_b64" in setup_module._oobe_data
+    assert "encryption_key_b64" in oobe_data
 
     # Step 2 validation errors.
-    missing = await setup_step_2(FakeFormRequest({"client_id": "", "client_secret": ""}))
+    missing = await setup_step_2(_MISSING_CREDS_FORM)
     assert missing.status_code == 200
     assert "required" in missing.context["error"].lower()
 
-    bad_client = await setup_step_2(
-        FakeFormRequest({"client_id": "not-google-id", "client_secret": "secret"})
-    )
+    bad_client = await setup_step_2(_BAD_CLIENT_ID_FORM)
     assert bad_client.status_code == 200
     assert "invalid client id format" in bad_client.context["error"].lower()
 
-    good = await setup_step_2(
-        FakeFormRequest(
-            {
-                "client_id": "good.apps.googleusercontent.com",
-                "client_secret": "secret",
-            }
-        )
-    )
+    good = await setup_step_2(_GOOD_CREDS_FORM)
     assert good.status_code == 302
     assert good.headers["location"] == "/setup?step=3"
-    assert setup_module._oobe_data["client_id"] == "good.apps.googleusercontent.com"
+    assert oobe_data["client_id"] == "good.apps.googleusercontent.com"
 
 
 @pytest.mark.asyncio
-async def test_setup_step3_paths_and_test_credentials(test_db, monkeypatch):
+async def test_setup_step3_paths_and_test_credentials(test_db, monkeypatch, oobe_data):
     """Step-3 auth callback should handle error, mismatch, success, and failure branches."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import step_3_auth, step_3_callback, step_3_confirm, test_credentials
-
-    setup_module._oobe_data.clear()
-
     async def fake_test_oauth_credentials(client_id: str, client_secret: str) -> bool:
         return client_id.startswith("good") and bool(client_secret)
 
     monkeypatch.setattr("app.auth.google.test_oauth_credentials", fake_test_oauth_credentials)
-    tested = await test_credentials(
-        FakeFormRequest({"client_id": "good.apps.googleusercontent.com", "client_secret": "s"})
-    )
+    tested = await _ui_setup.test_credentials(_TEST_CREDS_FORM)
     assert tested["valid"] is True
 
     # Missing client id in OOBE data -> back to step 2.
@@ -101,13 +107,13 @@ async def test_setup_step3_paths_and_test_credentials(test_db, monkeypatch):
     assert start.status_code == 302
     assert start.headers["location"] == "/setup?step=2"
 
-    setup_module._oobe_data["client_id"] = "good.apps.googleusercontent.com"
-    setup_module._oobe_data["client_secret"] = "secret"
+    oobe_data["client_id"] = "good.apps.googleusercontent.com"
+    oobe_data["client_secret"] = "secret"
     monkeypatch.setattr("app.auth.google.build_auth_url", lambda **_kwargs: "https://accounts.google.com/o/oauth2/v2/auth?z=1")
     start_ok = await step_3_auth(_request("/setup/step/3/auth"))
     assert start_ok.status_code == 302
     assert "accounts.google.com" in start_ok.headers["location"]
-    assert "oauth_state" in setup_module._oobe_data
+    assert "oauth_state" in oobe_data
 
     error_cb = await step_3_callback(_request("/setup/step/3/callback"), error="access_denied")
     assert "error=access_denied" in error_cb.headers["location"]
@@ -130,12 +136,12 @@ async def test_setup_step3_paths_and_test_credentials(test_db, monkeypatch):
     success = await step_3_callback(
         _request("/setup/step/3/callback"),
         code="auth-code",
-        state=setup_module._oobe_data["oauth_state"],
+        state=oobe_data["oauth_state"],
     )
     assert success.status_code == 302
     assert success.headers["location"] == "/setup?step=3"
-    assert setup_module._oobe_data["admin_email"] == "admin@example.com"
-    assert setup_module._oobe_data["domain"] == "example.com"
+    assert oobe_data["admin_email"] == "admin@example.com"
+    assert oobe_data["domain"] == "example.com"
 
     async def exploding_exchange(*_args, **_kwargs):
         raise RuntimeError("boom")
@@ -144,58 +150,41 @@ async def test_setup_step3_paths_and_test_credentials(test_db, monkeypatch):
     failed = await step_3_callback(
         _request("/setup/step/3/callback"),
         code="auth-code",
-        state=setup_module._oobe_data["oauth_state"],
+        state=oobe_data["oauth_state"],
     )
     assert "oauth_failed" in failed.headers["location"]
 
-    setup_module._oobe_data.pop("admin_email", None)
-    confirm_missing = await step_3_confirm(FakeFormRequest({}))
+    oobe_data.pop("admin_email", None)
+    confirm_missing = await step_3_confirm(_EMPTY_FORM)
     assert confirm_missing.headers["location"] == "/setup?step=3"
-    setup_module._oobe_data["admin_email"] = "admin@example.com"
-    confirm_ok = await step_3_confirm(FakeFormRequest({}))
+    oobe_data["admin_email"] = "admin@example.com"
+    confirm_ok = await step_3_confirm(_EMPTY_FORM)
     assert confirm_ok.headers["location"] == "/setup?step=4"
 
 
 @pytest.mark.asyncio
-async def test_setup_step4_and_step5_completion_flow(test_db, monkeypatch, tmp_path):
+async def test_setup_step4_and_step5_completion_flow(test_db, monkeypatch, oobe_data, tmp_path):
     """Steps 4 and 5 should persist OOBE data, complete setup, and clear temporary state."""
-    from app.ui import setup as setup_module
-    from app.ui.setup import setup_complete, setup_step_4, setup_step_5, test_email
-
-    setup_module._oobe_data.clear()
-
-    step4_disabled = await setup_step_4(FakeFormRequest({"enabled": ""}))
+    step4_disabled = await setup_step_4(_STEP4_DISABLED_FORM)
     assert step4_disabled.status_code == 302
-    assert setup_module._oobe_data["smtp_enabled"] is False
-
-    step4_enabled = await setup_step_4(
-        FakeFormRequest(
-            {
-                "enabled": "on",
-                "smtp_host": "smtp.example.com",
-                "smtp_port": "2525",
-                "smtp_username": "user",
-                "smtp_password": "pass",
-                "from_address": "noreply@example.com",
-                "alert_emails": "ops@example.com",
-            }
-        )
-    )
+    assert oobe_data["smtp_enabled"] is False
+
+    step4_enabled = await setup_step_4(_STEP4_ENABLED_FORM)
     assert step4_enabled.status_code == 302
-    assert setup_module._oobe_data["smtp_enabled"] is True
-    assert setup_module._oobe_data["smtp_port"] == 2525
+    assert oobe_data["smtp_enabled"] is True
+    assert oobe_data["smtp_port"] == 2525
 
-    assert (await test_email(FakeFormRequest({})))["success"] is True
+    assert (await _ui_setup.test_email(_EMPTY_FORM))["success"] is True
 
     # Step 5 requires confirmation.
-    setup_module._oobe_data["encryption_key_b64"] = "abc"
-    missing_confirm = await setup_step_5(FakeFormRequest({"confirmed": ""}))
+    oobe_data["encryption_key_b64"] = "abc"
+    missing_confirm = await setup_step_5(_STEP5_UNCONFIRMED_FORM)
     assert missing_confirm.status_code == 200
     assert "must confirm" in missing_confirm.context["error"].lower()
 
     # Complete setup path.
     key_path = tmp_path / "enc.key"
-    setup_module._oobe_data.update(
+    oobe_data.update(
         {
             "encryption_key": b"0" * 32,
             "client_id": "good.apps.googleusercontent.com",
@@ -219,17 +208,19 @@ async def test_setup_step4_and_step5_completion_flow(test_db, monkeypatch, tmp_p
 
     monkeypatch.setattr("app.ui.setup.get_settings", lambda: SimpleNamespace(encryption_key_file=str(key_path)))
 
-    completed = await setup_step_5(FakeFormRequest({"confirmed": "on"}))
+    completed = await setup_step_5(_STEP5_CONFIRMED_FORM)
     assert completed.status_code == 302
     assert completed.headers["location"] == "/setup?step=6"
     assert key_path.exists()
-    assert setup_module._oobe_data == {}
+    assert oobe_data == {}
 
     db = await get_database()
-    cursor = await db.execute("SELECT COUNT(*) FROM organization")
-    assert (await cursor.fetchone())[0] == 1
-    cursor = await db.execute("SELECT COUNT(*) FROM users WHERE is_admin = TRUE")
-    assert (await cursor.fetchone())[0] == 1
+    cursor = await db.execute(
+        "SELECT (SELECT COUNT(*) FROM organization), (SELECT COUNT(*) FROM users WHERE is_admin = TRUE)"
+    )
+    org_count, admin_count = await cursor.fetchone()
+    assert org_count == 1
+    assert admin_count == 1
 
     done = await setup_complete(_request("/setup/complete"))
     assert done.status_code == 302
@@ -2,89 +2,111 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
-
+from starlette.requests import Request
+
+from app.api import webhooks as _api_webhooks
+from app.api.webhooks import (
+    receive_google_calendar_webhook,
+    register_webhook_channel,
+    stop_webhook_channel,
+)
 from app.database import get_database
+from tests.conftest import FROZEN_NOW, INSERT_USER_SQL, freeze_utcnow, seed_user
+
+
+# The webhook module's clock is frozen at FROZEN_NOW; stored channels expire a day later.
+_EXPIRES_ISO = (FROZEN_NOW + timedelta(days=1)).isoformat()
+
+
+# The rate limiter wrapping the receiver only accepts a real starlette Request.
+_WEBHOOK_REQUEST = Request(
+    {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/webhooks/google-calendar",
+        "headers": [],
+        "client": ("127.0.0.1", 12345),
+    }
+)
+
+_INSERT_WEBHOOK_SQL = """INSERT INTO webhook_channels
+   (user_id, calendar_type, client_calendar_id, channel_id, resource_id, token, expiration)
+   VALUES (?, ?, ?, ?, ?, ?, ?)"""
 
 
 async def _insert_user(email: str, google_user_id: str, main_calendar_id: str | None = "main-cal") -> int:
     db = await get_database()
     cursor = await db.execute(
-        """INSERT INTO users (email, google_user_id, display_name, main_calendar_id)
-           VALUES (?, ?, ?, ?)
-           RETURNING id""",
+        INSERT_USER_SQL,
         (email, google_user_id, "User", main_calendar_id),
     )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+    return cursor.lastrowid
 
 
-async def _insert_token(user_id: int, email: str) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO oauth_tokens
-           (user_id, account_type, google_account_email, access_token_encrypted, refresh_token_encrypted)
-           VALUES (?, 'client', ?, ?, ?)
-           RETURNING id""",
-        (user_id, email, b"a", b"r"),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+class _FakeResp:
+    def __init__(self, status_code: int, text: str = ""):
+        self.status_code = status_code
+        self.text = text
 
+    def json(self):
+        return {}
 
-async def _insert_calendar(user_id: int, token_id: int, calendar_id: str) -> int:
-    db = await get_database()
-    cursor = await db.execute(
-        """INSERT INTO client_calendars
-           (user_id, oauth_token_id, google_calendar_id, display_name)
-           VALUES (?, ?, ?, ?)
-           RETURNING id""",
-        (user_id, token_id, calendar_id, calendar_id),
-    )
-    row = await cursor.fetchone()
-    await db.commit()
-    return row["id"]
+
+class _FakeAsyncClient:
+    """Stand-in for ``httpx.AsyncClient`` that answers every POST with one response."""
+
+    def __init__(self, resp: _FakeResp | None = None, raise_on_enter: Exception | None = None):
+        self._resp = resp
+        self._raise_on_enter = raise_on_enter
+
+    async def __aenter__(self):
+        if self._raise_on_enter is not None:
+            raise self._raise_on_enter
+        return self
+
+    async def __aexit__(self, *_args):
+        return None
+
+    async def post(self, *_args, **_kwargs):
+        return self._resp
+
+
+@pytest.fixture(autouse=True)
+def _frozen_clock(monkeypatch):
+    freeze_utcnow(monkeypatch, _api_webhooks)
 
 
 @pytest.mark.asyncio
 async def test_receive_webhook_triggers_main_sync_task_path(test_db, monkeypatch):
     """Webhook receiver should dispatch main-calendar task for main channels."""
-    from app.api.webhooks import receive_google_calendar_webhook
-
     user_id = await _insert_user("main-wh@example.com", "main-wh-google", main_calendar_id="main-wh")
     db = await get_database()
     await db.execute(
-        """INSERT INTO webhook_channels
-           (user_id, calendar_type, client_calendar_id, channel_id, resource_id, token, expiration)
-           VALUES (?, 'main', NULL, ?, ?, ?, ?)""",
+        _INSERT_WEBHOOK_SQL,
         (
             user_id,
+            "main",
+            None,
             "main-channel",
             "main-resource",
             "main-secret-token",
-            (datetime.utcnow() + timedelta(days=1)).isoformat(),
+            _EXPIRES_ISO,
         ),
     )
     await db.commit()
 
-    calls: list[str] = []
-
-    async def fake_trigger_sync_for_main_calendar(_user_id: int):
-        return None
-
-    def fake_create_background_task(coro, task_name: str = "task"):
-        calls.append(task_name)
-        coro.close()
+    fake_trigger = AsyncMock(return_value=None)
+    fake_create_background_task = MagicMock(side_effect=lambda coro, task_name="task": coro.close())
 
-    monkeypatch.setattr("app.sync.engine.trigger_sync_for_main_calendar", fake_trigger_sync_for_main_calendar)
+    monkeypatch.setattr("app.sync.engine.trigger_sync_for_main_calendar", fake_trigger)
     monkeypatch.setattr("app.utils.tasks.create_background_task", fake_create_background_task)
 
     result = await receive_google_calendar_webhook(
-        request=None,
+        request=_WEBHOOK_REQUEST,
         x_goog_channel_id="main-channel",
         x_goog_channel_token="main-secret-token",
         x_goog_resource_id="main-resource",
@@ -92,45 +114,49 @@ async def test_receive_webhook_triggers_main_sync_task_path(test_db, monkeypatch
         x_goog_message_number="2",
     )
     assert result == {"status": "ok"}
-    assert calls == [f"sync_main_calendar_user_{user_id}"]
+    fake_create_background_task.assert_called_once()
+    assert fake_create_background_task.call_args.args[1] == f"sync_main_calendar_user_{user_id}"
+    fake_trigger.assert_called_once()
+    assert fake_trigger.call_args.args == (user_id,)
 
 
 @pytest.mark.asyncio
 async def test_receive_webhook_returns_ok_when_trigger_fails(test_db, monkeypatch):
     """Webhook receiver should fail safe and return OK when trigger dispatch errors."""
-    from app.api.webhooks import receive_google_calendar_webhook
-
-    user_id = await _insert_user("client-wh@example.com", "client-wh-google", main_calendar_id="main")
-    token_id = await _insert_token(user_id, "client-wh-token@example.com")
-    calendar_id = await _insert_calendar(user_id, token_id, "client-wh-cal")
+    user_id, _, (calendar_id,) = await seed_user(
+        test_db,
+        "client-wh@example.com",
+        "client-wh-google",
+        main_calendar_id="main",
+        tokens=("client-wh-token@example.com",),
+        calendars=((0, "client-wh-cal"),),
+    )
     db = await get_database()
     await db.execute(
-        """INSERT INTO webhook_channels
-           (user_id, calendar_type, client_calendar_id, channel_id, resource_id, token, expiration)
-           VALUES (?, 'client', ?, ?, ?, ?, ?)""",
+        _INSERT_WEBHOOK_SQL,
         (
             user_id,
+            "client",
             calendar_id,
             "client-channel",
             "client-resource",
             "client-secret-token",
-            (datetime.utcnow() + timedelta(days=1)).isoformat(),
+            _EXPIRES_ISO,
         ),
     )
     await db.commit()
 
-    async def fake_trigger_sync_for_calendar(_calendar_id: int):
-        return None
+    fake_trigger = AsyncMock(return_value=None)
 
-    def exploding_background_task(coro, _task_name: str = "task"):
+    def exploding_background_task(coro, task_name: str = "task"):
         coro.close()
         raise RuntimeError("dispatch failed")
 
-    monkeypatch.setattr("app.sync.engine.trigger_sync_for_calendar", fake_trigger_sync_for_calendar)
+    monkeypatch.setattr("app.sync.engine.trigger_sync_for_calendar", fake_trigger)
     monkeypatch.setattr("app.utils.tasks.create_background_task", exploding_background_task)
 
     result = await receive_google_calendar_webhook(
-        request=None,
+        request=_WEBHOOK_REQUEST,
         x_goog_channel_id="client-channel",
         x_goog_channel_token="client-secret-token",
         x_goog_resource_id="client-resource",
@@ -144,28 +170,9 @@ async def test_receive_webhook_returns_ok_when_trigger_fails(test_db, monkeypatc
 @pytest.mark.asyncio
 async def test_register_webhook_channel_failure_status_raises(test_db, monkeypatch):
     """Register helper should raise ValueError when Google returns non-200."""
-    from app.api.webhooks import register_webhook_channel
-
     user_id = await _insert_user("reg-fail@example.com", "reg-fail-google")
 
-    class FakeResp:
-        status_code = 500
-        text = "upstream failed"
-
-        def json(self):
-            return {}
-
-    class FakeClient:
-        async def __aenter__(self):
-            return self
-
-        async def __aexit__(self, *_args):
-            return None
-
-        async def post(self, *_args, **_kwargs):
-            return FakeResp()
-
-    monkeypatch.setattr("httpx.AsyncClient", lambda: FakeClient())
+    monkeypatch.setattr("httpx.AsyncClient", lambda: _FakeAsyncClient(_FakeResp(500, "upstream failed")))
 
     with pytest.raises(ValueError):
         await register_webhook_channel(
@@ -179,60 +186,38 @@ async def test_register_webhook_channel_failure_status_raises(test_db, monkeypat
 @pytest.mark.asyncio
 async def test_stop_webhook_channel_non_success_and_exception_paths(test_db, monkeypatch):
     """Stop helper should return False for bad status and exceptions."""
-    from app.api.webhooks import stop_webhook_channel
-
-    class BadStatusResp:
-        status_code = 500
-        text = "bad stop"
-
-    class BadStatusClient:
-        async def __aenter__(self):
-            return self
-
-        async def __aexit__(self, *_args):
-            return None
-
-        async def post(self, *_args, **_kwargs):
-            return BadStatusResp()
-
-    monkeypatch.setattr("httpx.AsyncClient", lambda: BadStatusClient())
+    monkeypatch.setattr("httpx.AsyncClient", lambda: _FakeAsyncClient(_FakeResp(500, "bad stop")))
     assert await stop_webhook_channel("bad-status", "res", "token") is False
 
-    class ExplodingClient:
-        async def __aenter__(self):
-            raise RuntimeError("network down")
-
-        async def __aexit__(self, *_args):
-            return None
-
-    monkeypatch.setattr("httpx.AsyncClient", lambda: ExplodingClient())
+    monkeypatch.setattr(
+        "httpx.AsyncClient",
+        lambda: _FakeAsyncClient(raise_on_enter=RuntimeError("network down")),
+    )
     assert await stop_webhook_channel("explode", "res", "token") is False
 
 
 @pytest.mark.asyncio
 async def test_receive_webhook_rejects_wrong_token(test_db):
     """Webhook receiver should silently drop notifications with a bad token."""
-    from app.api.webhooks import receive_google_calendar_webhook
-
     user_id = await _insert_user("token-wh@example.com", "token-wh-google", main_calendar_id="token-main")
     db = await get_database()
     await db.execute(
-        """INSERT INTO webhook_channels
-           (user_id, calendar_type, client_calendar_id, channel_id, resource_id, token, expiration)
-           VALUES (?, 'main', NULL, ?, ?, ?, ?)""",
+        _INSERT_WEBHOOK_SQL,
         (
             user_id,
+            "main",
+            None,
             "token-channel",
             "token-resource",
             "correct-secret",
-            (datetime.utcnow() + timedelta(days=1)).isoformat(),
+            _EXPIRES_ISO,
         ),
     )
     await db.commit()
 
     # Missing token
     result = await receive_google_calendar_webhook(
-        request=None,
+        request=_WEBHOOK_REQUEST,
         x_goog_channel_id="token-channel",
         x_goog_channel_token=None,
         x_goog_resource_id="token-resource",
@@ -243,7 +228,7 @@ async def test_receive_webhook_rejects_wrong_token(test_db):
 
     # Wrong token
     result = await receive_google_calendar_webhook(
-        request=None,
+        request=_WEBHOOK_REQUEST,
         x_goog_channel_id="token-channel",
         x_goog_channel_token="wrong-secret",
         x_goog_resource_id="token-resource",